@@ -1,24 +1,22 @@
 from __future__ import annotations
 
 from pathlib import Path
-from datetime import datetime, time
+from datetime import datetime
 from zoneinfo import ZoneInfo
 import calendar
 import io
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
-# PDF (ReportLab)
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-
 
 # -----------------------------
 # Config
 # -----------------------------
 BASE_DIR = Path(__file__).resolve().parent
-EXCEL_PATH = BASE_DIR / "data" / "turnos_2026.xlsx"
+# Fuente editable: data/turnos_2026.xlsx; se regenera con scripts/build_parquet.py
+PARQUET_PATH = BASE_DIR / "data" / "turnos_2026.parquet"
 TZ = ZoneInfo("Europe/Madrid")
 
 st.set_page_config(page_title="Turnos de riego", layout="wide")
@@ -30,86 +28,165 @@ modo_movil = st.toggle("📱 Modo móvil", value=False)
 # -----------------------------
 # Helpers
 # -----------------------------
-def parse_hora(h: str) -> time:
-    """Convierte strings tipo '0 AM', '8 AM', '4 PM' a datetime.time."""
-    s = str(h).strip().upper()
-    parts = s.split()
-    if len(parts) != 2:
-        raise ValueError(f"Formato de HORA no soportado: {h}")
-
-    hour = int(parts[0])
-    ampm = parts[1]
-
-    if ampm == "AM":
-        if hour == 12:
-            hour = 0
-    elif ampm == "PM":
-        if hour != 12:
-            hour += 12
-    else:
-        raise ValueError(f"AM/PM no reconocido: {h}")
-
-    return time(hour=hour, minute=0)
+def build_pdf(df: pd.DataFrame, titulo: str) -> bytes:
+    """Genera un PDF simple con la agenda filtrada.
 
+    Usa un único TextObject por página (un solo bloque BT/ET en el stream)
+    en vez de tres drawString por fila.
+    """
+    # Import perezoso: ReportLab es pesado y solo hace falta al generar el PDF.
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
 
-def build_pdf(df: pd.DataFrame, titulo: str) -> bytes:
-    """Genera un PDF simple con la agenda filtrada."""
     buffer = io.BytesIO()
     c = canvas.Canvas(buffer, pagesize=A4)
     width, height = A4
 
     x = 40
+
+    def cabecera(t, y: float) -> float:
+        """Escribe la cabecera de tabla y devuelve la y de la primera fila."""
+        t.setFont("Helvetica-Bold", 11)
+        t.setTextOrigin(x, y)
+        t.textOut("FECHA")
+        t.setTextOrigin(x + 120, y)
+        t.textOut("HORA")
+        t.setTextOrigin(x + 220, y)
+        t.textOut("TURNO")
+        c.line(x, y - 12, width - 40, y - 12)
+        t.setFont("Helvetica", 10)
+        return y - 30
+
     y = height - 50
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(x, y, titulo)
+    t = c.beginText()
+    t.setFont("Helvetica-Bold", 14)
+    t.setTextOrigin(x, y)
+    t.textOut(titulo)
 
     y -= 25
-    c.setFont("Helvetica", 10)
-    c.drawString(x, y, f"Generado: {datetime.now(TZ).strftime('%d/%m/%Y %H:%M')}")
+    t.setFont("Helvetica", 10)
+    t.setTextOrigin(x, y)
+    t.textOut(f"Generado: {datetime.now(TZ).strftime('%d/%m/%Y %H:%M')}")
 
-    y -= 30
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(x, y, "FECHA")
-    c.drawString(x + 120, y, "HORA")
-    c.drawString(x + 220, y, "TURNO")
-    y -= 12
-    c.line(x, y, width - 40, y)
-    y -= 18
+    y = cabecera(t, y - 30)
 
-    c.setFont("Helvetica", 10)
-
-    for _, r in df.iterrows():
+    filas = zip(
+        df["FECHA_STR"].to_numpy(),
+        df["HORA"].to_numpy(),
+        df["TURNO"].to_numpy(),
+    )
+    for fecha_str, hora, turno in filas:
         if y < 60:
+            c.drawText(t)
             c.showPage()
-            y = height - 50
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(x, y, "FECHA")
-            c.drawString(x + 120, y, "HORA")
-            c.drawString(x + 220, y, "TURNO")
-            y -= 12
-            c.line(x, y, width - 40, y)
-            y -= 18
-            c.setFont("Helvetica", 10)
-
-        c.drawString(x, y, r["FECHA_STR"])
-        c.drawString(x + 120, y, str(r["HORA"]))
-        c.drawString(x + 220, y, str(r["TURNO"]))
+            t = c.beginText()
+            y = cabecera(t, height - 50)
+
+        t.setTextOrigin(x, y)
+        t.textOut(fecha_str)
+        t.setTextOrigin(x + 120, y)
+        t.textOut(str(hora))
+        t.setTextOrigin(x + 220, y)
+        t.textOut(str(turno))
         y -= 16
 
+    c.drawText(t)
     c.save()
     buffer.seek(0)
     return buffer.getvalue()
 
 
+@st.cache_data(show_spinner=False)
+def build_pdf_cached(rows: tuple[tuple[str, str, str], ...], titulo: str) -> bytes:
+    """Memoiza build_pdf: mismas filas + mismo título => mismo PDF, sin regenerar."""
+    df = pd.DataFrame(rows, columns=["FECHA_STR", "HORA", "TURNO"])
+    return build_pdf(df, titulo)
+
+
+def build_cards_html(df: pd.DataFrame, color_map: dict[str, str], compact: bool = False) -> str:
+    """Concatena las tarjetas de la agenda en un único bloque HTML (un solo st.markdown)."""
+    piezas = []
+    for fecha_str, hora, turno in zip(
+        df["FECHA_STR"].to_numpy(),
+        df["HORA"].to_numpy(),
+        df["TURNO"].to_numpy(),
+    ):
+        color = color_map.get(turno, "#4da6ff")
+        if compact:
+            piezas.append(
+                f"<div style='padding:10px;border-radius:10px;margin-bottom:6px;background:#f4f6f8;border-left:6px solid {color};'>"
+                f"<strong>{fecha_str}</strong> · {hora} · {turno}</div>"
+            )
+        else:
+            piezas.append(
+                f"<div style='padding:12px;border-radius:10px;margin-bottom:8px;background-color:#f4f6f8;border-left:6px solid {color};'>"
+                f"<strong>{fecha_str}</strong>"
+                f"&nbsp;&nbsp;🕒 {hora}"
+                f"&nbsp;&nbsp;👤 {turno}</div>"
+            )
+    return "".join(piezas)
+
+
+# Estilos estáticos del calendario, fuera de la función para no reconstruirlos.
+_CAL_TH_STYLE = "border:1px solid #ddd; padding:8px; text-align:center; background:#f4f6f8;"
+_CAL_TD_STYLE = "border:1px solid #ddd; padding:8px; vertical-align:top; height:86px;"
+_CAL_HOY_STYLE = "background:#fff3cd; border-radius:8px; padding:6px;"
+
+
+@st.fragment
+def render_agenda(df_agenda: pd.DataFrame, color_map: dict[str, str], modo_movil: bool) -> None:
+    """Agenda paginada como fragment: cambiar de página no re-ejecuta el script entero."""
+    if df_agenda.empty:
+        st.info("No hay turnos que mostrar con los filtros actuales.")
+        return
+
+    # Paginación: solo se materializa el HTML de la página visible.
+    POR_PAGINA = 25
+    n_paginas = (len(df_agenda) + POR_PAGINA - 1) // POR_PAGINA
+    if n_paginas > 1:
+        pagina = st.number_input("Página", min_value=1, max_value=n_paginas, value=1)
+    else:
+        pagina = 1
+
+    inicio = (pagina - 1) * POR_PAGINA
+    df_pagina = df_agenda.iloc[inicio : inicio + POR_PAGINA]
+
+    st.markdown(
+        build_cards_html(df_pagina, color_map, compact=modo_movil),
+        unsafe_allow_html=True,
+    )
+    if n_paginas > 1:
+        st.caption(
+            f"Mostrando {inicio + 1}–{inicio + len(df_pagina)} de {len(df_agenda)} turnos"
+        )
+
+
+@st.fragment
+def render_export(df_agenda: pd.DataFrame, turno_sel: str, mes_sel: str) -> None:
+    """Sección de exportación a PDF, aislada del resto de la UI."""
+    pdf_df = df_agenda[["FECHA_STR", "HORA", "TURNO"]]
+    titulo_pdf = f"Agenda de riego 2026 - {turno_sel} - {mes_sel}"
+    rows_key = tuple(map(tuple, pdf_df.to_numpy()))
+    pdf_bytes = build_pdf_cached(rows_key, titulo_pdf)
+
+    st.download_button(
+        label="⬇️ Descargar PDF (agenda filtrada)",
+        data=pdf_bytes,
+        file_name="agenda_riego_2026.pdf",
+        mime="application/pdf",
+    )
+
+
+@st.fragment
 def render_month_calendar(df_month: pd.DataFrame, year: int, month: int) -> None:
     """Render calendario mensual (grid) con los turnos en cada día y 'hoy' resaltado."""
-    df_month = df_month.copy()
-    df_month["DAY"] = df_month["FECHA"].dt.day
-
-    events_by_day: dict[int, list[str]] = {}
-    for _, r in df_month.iterrows():
-        d = int(r["DAY"])
-        events_by_day.setdefault(d, []).append(f"{r['HORA']} · {r['TURNO']}")
+    events_by_day: dict[int, list[str]] = {
+        int(d): [
+            f"{hora} · {turno}"
+            for hora, turno in zip(sub["HORA"].to_numpy(), sub["TURNO"].to_numpy())
+        ]
+        for d, sub in df_month.groupby("DAY", sort=False, observed=True)
+    }
 
     cal = calendar.Calendar(firstweekday=0)  # Lunes
     weeks = cal.monthdayscalendar(year, month)
@@ -138,59 +215,72 @@ def render_month_calendar(df_month: pd.DataFrame, year: int, month: int) -> None
 
             highlight = today_day is not None and day == today_day
             if highlight:
-                cell = f"<div style='background:#fff3cd; border-radius:8px; padding:6px;'>{inner}</div>"
+                cell = f"<div style='{_CAL_HOY_STYLE}'>{inner}</div>"
             else:
                 cell = inner
 
             row.append(cell)
         rows.append(row)
 
-    table_html = "<table style='width:100%; border-collapse:collapse;'>"
-    table_html += (
-        "<tr>"
-        + "".join(
-            f"<th style='border:1px solid #ddd; padding:8px; text-align:center; background:#f4f6f8;'>{h}</th>"
-            for h in headers
-        )
-        + "</tr>"
-    )
+    # Fragmentos acumulados en una lista y un único join al final.
+    parts = ["<table style='width:100%; border-collapse:collapse;'>", "<tr>"]
+    parts.extend(f"<th style='{_CAL_TH_STYLE}'>{h}</th>" for h in headers)
+    parts.append("</tr>")
 
     for r in rows:
-        table_html += (
-            "<tr>"
-            + "".join(
-                f"<td style='border:1px solid #ddd; padding:8px; vertical-align:top; height:86px;'>{cell}</td>"
-                for cell in r
-            )
-            + "</tr>"
-        )
+        parts.append("<tr>")
+        parts.extend(f"<td style='{_CAL_TD_STYLE}'>{cell}</td>" for cell in r)
+        parts.append("</tr>")
 
-    table_html += "</table>"
-    st.markdown(table_html, unsafe_allow_html=True)
+    parts.append("</table>")
+    st.markdown("".join(parts), unsafe_allow_html=True)
 
 
 # -----------------------------
 # Load
 # -----------------------------
-@st.cache_data
-def cargar_datos() -> pd.DataFrame:
-    df = pd.read_excel(EXCEL_PATH, engine="openpyxl")
+# Versión del esquema del snapshot: súbela al cambiar las columnas derivadas,
+# dtypes o attrs que cargar_datos añade, o el pickle viejo se serviría igual.
+_SNAPSHOT_VERSION = 2
 
-    df.columns = df.columns.astype(str).str.strip().str.upper()
-    df = df.loc[:, ["FECHA", "HORA", "TURNO"]].copy()
 
-    df["FECHA"] = pd.to_datetime(df["FECHA"], errors="coerce")
-    df = df.dropna(subset=["FECHA", "HORA", "TURNO"])
-
-    df["HORA"] = df["HORA"].astype(str).str.strip()
-    df["TURNO"] = df["TURNO"].astype(str).str.strip()
-
-    df["HORA_T"] = df["HORA"].apply(parse_hora)
-    df["DT"] = df.apply(
-        lambda r: datetime.combine(r["FECHA"].date(), r["HORA_T"], tzinfo=TZ), axis=1
+@st.cache_resource
+def cargar_datos() -> pd.DataFrame:
+    # Snapshot en disco keyed por versión + mtime: tras un reinicio del worker
+    # basta un pickle.load en vez de re-parsear el Parquet.
+    mtime = PARQUET_PATH.stat().st_mtime_ns
+    cache_path = BASE_DIR / ".cache" / f"turnos_v{_SNAPSHOT_VERSION}_{mtime}.pkl"
+    if cache_path.exists():
+        return pd.read_pickle(cache_path)
+
+    df = pd.read_parquet(PARQUET_PATH)
+
+    # Columnas derivadas de presentación: se calculan una vez aquí y las
+    # vistas filtradas las heredan sin re-formatear fechas en cada rerun.
+    df["FECHA_STR"] = df["FECHA"].dt.strftime("%d/%m/%y").astype("string")
+    df["MONTH_LABEL"] = df["FECHA"].dt.strftime("%m/%Y").astype("string")
+    df["DAY"] = df["FECHA"].dt.day.astype("int8")
+
+    # Pocos valores únicos: como category, los filtros de igualdad comparan
+    # códigos enteros en vez de strings.
+    df["TURNO"] = df["TURNO"].astype("category")
+    df["HORA"] = df["HORA"].astype("category")
+
+    # Un único campo concatenado para la búsqueda rápida: una sola pasada
+    # de str.contains en vez de tres.
+    df["SEARCH_BLOB"] = (
+        (df["TURNO"].astype(str) + "|" + df["HORA"].astype(str) + "|" + df["FECHA_STR"])
+        .str.lower()
+        .astype("string")
     )
 
-    df = df.sort_values("DT").reset_index(drop=True)
+    # Índices por grupo precalculados: el filtro por persona/mes se vuelve
+    # un df.take en vez de materializar una máscara booleana por rerun.
+    df.attrs["turno_idx"] = dict(df.groupby("TURNO", observed=True).indices)
+    df.attrs["mes_idx"] = dict(df.groupby("MONTH_LABEL", observed=True).indices)
+
+    cache_path.parent.mkdir(exist_ok=True)
+    df.to_pickle(cache_path, protocol=5)
     return df
 
 
@@ -209,11 +299,10 @@ palette = [
     "#84cc16",
     "#f97316",
 ]
-personas = sorted(df["TURNO"].unique().tolist())
+personas = df["TURNO"].cat.categories.tolist()  # ya ordenadas
 color_map = {p: palette[i % len(palette)] for i, p in enumerate(personas)}
 
 # Meses presentes
-df["MONTH_LABEL"] = df["FECHA"].dt.strftime("%m/%Y")
 months_present = sorted(df["MONTH_LABEL"].unique().tolist())
 
 # -----------------------------
@@ -231,13 +320,16 @@ else:
     mes_sel = c2.selectbox("Mes", ["(Todos)"] + months_present)
     q = c3.text_input("Búsqueda rápida (turno / hora / fecha)", value="").strip()
 
-df_view = df.copy()
-
+idx = None
 if turno_sel != "(Todos)":
-    df_view = df_view[df_view["TURNO"] == turno_sel]
+    idx = df.attrs["turno_idx"][turno_sel]
 
 if mes_sel != "(Todos)":
-    df_view = df_view[df_view["MONTH_LABEL"] == mes_sel]
+    idx_mes = df.attrs["mes_idx"][mes_sel]
+    idx = idx_mes if idx is None else np.intersect1d(idx, idx_mes, assume_unique=True)
+
+# Sin filtros no hay copia: los pasos posteriores solo leen o reasignan df_view.
+df_view = df.take(idx) if idx is not None else df
 
 # -----------------------------
 # Atajos: Hoy / Esta semana
@@ -257,48 +349,49 @@ end_week = start_week + pd.Timedelta(days=7)  # próximo lunes (exclusivo)
 
 if hoy_click:
     st.session_state["rango_atajo"] = (
-        datetime.combine(today, time(0, 0), tzinfo=TZ),
-        datetime.combine(today + pd.Timedelta(days=1), time(0, 0), tzinfo=TZ),
+        pd.Timestamp(today, tz=TZ),
+        pd.Timestamp(today + pd.Timedelta(days=1), tz=TZ),
     )
 
 if semana_click:
     st.session_state["rango_atajo"] = (
-        datetime.combine(start_week, time(0, 0), tzinfo=TZ),
-        datetime.combine(end_week, time(0, 0), tzinfo=TZ),
+        pd.Timestamp(start_week, tz=TZ),
+        pd.Timestamp(end_week, tz=TZ),
     )
 
 if reset_click:
     st.session_state["rango_atajo"] = None
 
 if st.session_state["rango_atajo"] is not None:
+    # DT está ordenado: el rango [a, b) es un corte por búsqueda binaria,
+    # sin materializar dos máscaras booleanas.
     a, b = st.session_state["rango_atajo"]
-    df_view = df_view[(df_view["DT"] >= a) & (df_view["DT"] < b)]
+    lo = int(df_view["DT"].searchsorted(a, side="left"))
+    hi = int(df_view["DT"].searchsorted(b, side="left"))
+    df_view = df_view.iloc[lo:hi]
 
 # -----------------------------
 # Búsqueda rápida (aplica después de filtros/atajos)
 # -----------------------------
 if q:
-    tmp = df_view.copy()
-    tmp["FECHA_STR"] = tmp["FECHA"].dt.strftime("%d/%m/%y")
-    mask = (
-        tmp["TURNO"].str.contains(q, case=False, na=False)
-        | tmp["HORA"].astype(str).str.contains(q, case=False, na=False)
-        | tmp["FECHA_STR"].str.contains(q, case=False, na=False)
-    )
-    df_view = tmp[mask].drop(columns=["FECHA_STR"])
+    # regex=False: búsqueda de substring pura, sin compilar una regex.
+    mask = df_view["SEARCH_BLOB"].str.contains(q.lower(), regex=False, na=False)
+    df_view = df_view[mask]
 
 # -----------------------------
 # Próximo turno
 # -----------------------------
 st.subheader("⏳ Próximo turno")
 
-now = datetime.now(TZ)
-df_future = df_view[df_view["DT"] >= now].copy()
+# df_view conserva el orden por DT, así que el primer turno futuro se
+# localiza con una búsqueda binaria en vez de una máscara sobre todas las filas.
+now = pd.Timestamp.now(tz=TZ)
+i_futuro = int(df_view["DT"].searchsorted(now))
 
-if df_future.empty:
+if i_futuro >= len(df_view):
     st.info("No hay turnos futuros para los filtros seleccionados.")
 else:
-    nxt = df_future.sort_values("DT").iloc[0]
+    nxt = df_view.iloc[i_futuro]
     delta = nxt["DT"] - now
 
     days = delta.days
@@ -320,29 +413,11 @@ else:
 # -----------------------------
 st.subheader("➡️ Próximos 5 turnos")
 
-df_next5 = df_view[df_view["DT"] >= now].sort_values("DT").head(5).copy()
+df_next5 = df_view.iloc[i_futuro : i_futuro + 5]
 if df_next5.empty:
     st.info("No hay próximos turnos con los filtros actuales.")
 else:
-    df_next5["FECHA_STR"] = df_next5["FECHA"].dt.strftime("%d/%m/%y")
-    for _, row in df_next5.iterrows():
-        color = color_map.get(row["TURNO"], "#4da6ff")
-        st.markdown(
-            f"""
-            <div style="
-                padding:12px;
-                border-radius:10px;
-                margin-bottom:8px;
-                background-color:#f4f6f8;
-                border-left:6px solid {color};
-            ">
-                <strong>{row['FECHA_STR']}</strong>
-                &nbsp;&nbsp;🕒 {row['HORA']}
-                &nbsp;&nbsp;👤 {row['TURNO']}
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+    st.markdown(build_cards_html(df_next5, color_map), unsafe_allow_html=True)
 
 # -----------------------------
 # Calendario mensual (grid)
@@ -365,52 +440,12 @@ else:
 # -----------------------------
 st.subheader("📅 Agenda")
 
-df_agenda = df_view.sort_values("DT").copy()
-df_agenda["FECHA_STR"] = df_agenda["FECHA"].dt.strftime("%d/%m/%y")
-
-if df_agenda.empty:
-    st.info("No hay turnos que mostrar con los filtros actuales.")
-else:
-    if modo_movil:
-        for _, row in df_agenda.iterrows():
-            color = color_map.get(row["TURNO"], "#4da6ff")
-            st.markdown(
-                f"<div style='padding:10px;border-radius:10px;margin-bottom:6px;background:#f4f6f8;border-left:6px solid {color};'>"
-                f"<strong>{row['FECHA_STR']}</strong> · {row['HORA']} · {row['TURNO']}</div>",
-                unsafe_allow_html=True,
-            )
-    else:
-        for _, row in df_agenda.iterrows():
-            color = color_map.get(row["TURNO"], "#4da6ff")
-            st.markdown(
-                f"""
-                <div style="
-                    padding:12px;
-                    border-radius:10px;
-                    margin-bottom:8px;
-                    background-color:#f4f6f8;
-                    border-left:6px solid {color};
-                ">
-                    <strong>{row['FECHA_STR']}</strong>
-                    &nbsp;&nbsp;🕒 {row['HORA']}
-                    &nbsp;&nbsp;👤 {row['TURNO']}
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
+df_agenda = df_view
+render_agenda(df_agenda, color_map, modo_movil)
 
 # -----------------------------
 # Exportar PDF
 # -----------------------------
 st.subheader("🧾 Exportar")
 
-pdf_df = df_agenda[["FECHA_STR", "HORA", "TURNO"]].copy()
-titulo_pdf = f"Agenda de riego 2026 - {turno_sel} - {mes_sel}"
-pdf_bytes = build_pdf(pdf_df, titulo_pdf)
-
-st.download_button(
-    label="⬇️ Descargar PDF (agenda filtrada)",
-    data=pdf_bytes,
-    file_name="agenda_riego_2026.pdf",
-    mime="application/pdf",
-)
+render_export(df_agenda, turno_sel, mes_sel)
@@ -0,0 +1,66 @@
+"""Convierte data/turnos_2026.xlsx a data/turnos_2026.parquet.
+
+El xlsx sigue siendo la fuente editable; este script se ejecuta una vez
+(o en CI) tras cada cambio para regenerar el Parquet tipado que lee la app.
+
+Uso: python scripts/build_parquet.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+EXCEL_PATH = BASE_DIR / "data" / "turnos_2026.xlsx"
+PARQUET_PATH = BASE_DIR / "data" / "turnos_2026.parquet"
+TZ = ZoneInfo("Europe/Madrid")
+
+
+def parse_horas(horas: pd.Series) -> pd.Series:
+    """Convierte una Series de strings tipo '0 AM', '8 AM', '4 PM' a hora entera (0-23)."""
+    partes = horas.str.upper().str.strip().str.extract(r"^(\d+)\s*(AM|PM)$")
+    if partes.isna().any().any():
+        malas = horas[partes.isna().any(axis=1)].unique().tolist()
+        raise ValueError(f"Formato de HORA no soportado: {malas}")
+
+    # '12 AM' -> 0, '12 PM' -> 12, resto: PM suma 12.
+    return partes[0].astype(int) % 12 + partes[1].eq("PM") * 12
+
+
+def build() -> pd.DataFrame:
+    df = pd.read_excel(
+        EXCEL_PATH,
+        engine="calamine",
+        usecols=["FECHA", "HORA", "TURNO"],
+        dtype={"HORA": "string", "TURNO": "string"},
+    )
+
+    df.columns = df.columns.astype(str).str.strip().str.upper()
+
+    df["FECHA"] = pd.to_datetime(df["FECHA"], errors="coerce")
+    df = df.dropna(subset=["FECHA", "HORA", "TURNO"])
+
+    df["HORA"] = df["HORA"].astype(str).str.strip()
+    df["TURNO"] = df["TURNO"].astype(str).str.strip()
+
+    horas = parse_horas(df["HORA"])
+    df["DT"] = (
+        df["FECHA"].dt.normalize() + pd.to_timedelta(horas, unit="h")
+    ).dt.tz_localize(TZ)
+
+    df = df.sort_values("DT").reset_index(drop=True)
+
+    # La app compara y hace searchsorted sobre DT; tiene que ser datetime64
+    # con tz, no objetos Python.
+    assert isinstance(df["DT"].dtype, pd.DatetimeTZDtype), df["DT"].dtype
+
+    return df
+
+
+if __name__ == "__main__":
+    df = build()
+    df.to_parquet(PARQUET_PATH, engine="pyarrow", compression="zstd")
+    print(f"{PARQUET_PATH.name}: {len(df)} filas")